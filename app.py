@@ -58,13 +58,13 @@ def manual_validation(type, dataset, samples, stopping_criterion=0, n_trees=10,
         else:
             classifier = AdaBoost(n_stumps=n_stumps)
 
-        tic = time.clock()
+        tic = time.perf_counter()
         if type == "tree":
             classifier.fit(x_train, y_train, stopping_criterion)
         else:
             classifier.fit(x_train, y_train)
 
-        toc = time.clock()
+        toc = time.perf_counter()
         train_score = classifier.score(x_train, y_train)
         test_score = classifier.score(x_test, y_test)
 
@@ -76,7 +76,6 @@ def manual_validation(type, dataset, samples, stopping_criterion=0, n_trees=10,
         print("%0.2f\t%0.2f\t%0.4f" %
             (train_score * 100 , test_score * 100, time_diff ))
 
-    total_toc = time.clock
     print("\n=== Averages ===")
     print("%0.2f\t%0.2f\t%0.4f" %
         (average_train*100/samples, average_test*100/samples, average_time / samples))
@@ -84,9 +83,9 @@ def manual_validation(type, dataset, samples, stopping_criterion=0, n_trees=10,
 def run_cross_validation(name, classifier, x, y, samples):
     print("%s is running " % name)
     cv = ShuffleSplit(n_splits=samples, test_size=0.2)
-    tic = time.clock()
-    scores = cross_val_score(classifier, x, y, cv=cv)
-    toc = time.clock()
+    tic = time.perf_counter()
+    scores = cross_val_score(classifier, x, y, cv=cv, n_jobs=-1)
+    toc = time.perf_counter()
 
     print("Accuracy: %0.2f (+/- %0.2f) Time: %0.4f (Each: %0.4f)\n" %
         (scores.mean(), scores.std() * 2, toc - tic, ( toc - tic) / samples) )
@@ -113,7 +112,8 @@ def compare(binary=0, dataset_index = 0, samples = 10):
     #name = "Tree"
     #run_cross_validation(name, classifier, x, y, samples)
 
-    classifier = RandomForest()
+    # The splits already run in parallel, so each forest trains its trees serially
+    classifier = RandomForest(n_jobs=1)
     name = "RandomForest"
     run_cross_validation(name, classifier, x, y, samples)
 
@@ -31,3 +31,17 @@ def make_two_class(x, y):
             y_2c.append(y[i])
             x_2c.append(x[i])
     return np.array(x_2c), np.array(y_2c)
+
+def get_random_subsets(x, y, n_subsets, replace=False, rng=None):
+    # Each subset uses 50% of the samples, indexed straight out of x and y
+    rng = np.random.default_rng(rng)
+    n_samples = np.shape(x)[0]
+    subsample_size = int(n_samples / 2)
+    subsets = []
+    for _ in range(n_subsets):
+        if replace:
+            idx = rng.integers(0, n_samples, size=subsample_size)
+        else:
+            idx = rng.choice(n_samples, size=subsample_size, replace=False)
+        subsets.append((x[idx], y[idx]))
+    return subsets
@@ -1,16 +1,55 @@
 import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
 from tree import Tree
+from helpers import get_random_subsets
+
+
+def _fit_one_tree(x_subset, y_subset, max_features, stopping_criteria, parallel, splitter, rng):
+    """
+    Fit a single tree of the forest on its subset of the data, using
+    a random subset of max_features of the features drawn from the tree's
+    own Generator. Module level so it can be pickled off to the
+    worker processes.
+    """
+    tree = Tree(parallel=parallel, splitter=splitter, random_state=rng)
+
+    # Feature bagging (select random subsets of the features)
+    idx = rng.integers( 0, x_subset.shape[1], size=max_features )
+
+    # Save the indices of the features for prediction
+    tree.feature_indices = idx
+
+    # Fit the tree to the data, on the features corresponding to the indices
+    tree.fit( x_subset[:, idx], y_subset, stopping_criteria = stopping_criteria )
+    return tree
+
+
+def _predict_one_tree(tree, x):
+    # Indices of the features that the tree has trained on
+    return tree.get_predictions( x[:, tree.feature_indices] )
 
 class RandomForest():
 
     """
     Random Forest.
     Uses an ensemble of decision trees trained on random subset of features with
-    a random subset of the data
+    a random subset of the data.
+    The trees are independent so they are trained in parallel processes,
+    n_jobs follows the joblib convention (-1 uses every core).
+    random_state seeds every random draw the forest makes, each tree gets
+    its own independent Generator spawned from it so the forest is
+    reproducible however the trees are spread over the workers.
+    splitter = "random" makes it a forest of extremely randomised trees.
+    Each tree's subset of the data is drawn without replacement, unless
+    bootstrap is set
     """
-    def __init__( self, n_trees=10, max_features=None, stopping_criteria = 1):
+    def __init__( self, n_trees=10, max_features=None, stopping_criteria = 1, n_jobs=-1, random_state=None, splitter="best", bootstrap=False):
         self.n_trees = n_trees
         self.max_features = max_features
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.splitter = splitter
+        self.bootstrap = bootstrap
 
         # this is to remove the samples/10 default stopping_criteria of the trees
         self.stopping_criteria = stopping_criteria
@@ -26,7 +65,11 @@ class RandomForest():
         return {
             "n_trees": self.n_trees,
             "max_features": self.max_features,
-            "stopping_criteria": self.stopping_criteria
+            "stopping_criteria": self.stopping_criteria,
+            "n_jobs": self.n_jobs,
+            "random_state": self.random_state,
+            "splitter": self.splitter,
+            "bootstrap": self.bootstrap
         }
 
     # Methods to match skilearn interface specification
@@ -42,71 +85,43 @@ class RandomForest():
             self.max_features = int( np.sqrt( n_features ) )
 
 
+        rng = np.random.default_rng( self.random_state )
+        tree_rngs = rng.spawn( self.n_trees )
+
         # Choose one random subset of the data for each tree
-        subsets = []
-        n_samples = np.shape(x)[0]
-        x_y = np.concatenate((x, y.reshape((1, len(y))).T), axis=1)
-        np.random.shuffle(x_y)
-        # Uses 50% of training samples without replacements
-        subsample_size = int(n_samples / 2)
-        for _ in range(self.n_trees):
-            x_indice = np.random.choice(
-                range(n_samples), size=np.shape(range(subsample_size)), replace=False
+        subsets = get_random_subsets( x, y, self.n_trees, replace=self.bootstrap, rng=rng )
+
+        # Each tree already runs in its own process, so don't thread the split search too
+        parallel_splits = effective_n_jobs( self.n_jobs ) == 1
+        self.the_forest = Parallel( n_jobs=self.n_jobs, backend="loky" )(
+            delayed( _fit_one_tree )(
+                subsets[i][0], subsets[i][1], self.max_features,
+                self.stopping_criteria, parallel_splits, self.splitter, tree_rngs[i]
             )
-            x = x_y[x_indice][:, :-1]
-            y = x_y[x_indice][:, -1]
-            subsets.append([x, y])
-
-        for i in range( self.n_trees ):
-            x_subset, y_subset = subsets[i]
-
-            # Feature bagging (select random subsets of the features)
-            idx = np.random.choice( range( n_features ), size=self.max_features, replace=True )
-
-            # Save the indices of the features for prediction
-            self.the_forest[i].feature_indices = idx
-
-            # Choose the features corresponding to the indices
-            x_subset = x_subset[:, idx]
-
-            # Fit the tree to the data
-            self.the_forest[i].fit( x_subset, y_subset, stopping_criteria = self.stopping_criteria )
+            for i in range( self.n_trees )
+        )
 
 
     def predict( self, x):
         # Height number of samples, width number of trees
-        predictions = np.empty( ( x.shape[0], len( self.the_forest ) ) )
+        predictions = np.empty( ( x.shape[0], len( self.the_forest ) ), dtype=np.int64 )
 
         # Let each tree make a prediction on the data
-        for i, tree in enumerate( self.the_forest ):
-            # Indices of the features that the tree has trained on
-            idx = tree.feature_indices
-
-            prediction = tree.get_predictions( x[:, idx] )
-
+        tree_predictions = Parallel( n_jobs=self.n_jobs, backend="loky" )(
+            delayed( _predict_one_tree )( tree, x ) for tree in self.the_forest
+        )
+        for i, prediction in enumerate( tree_predictions ):
             predictions[:, i] = prediction
 
-        predictions = np.array(predictions)
-
-
-
-        top_voted = np.empty( predictions.shape[0] )
-
-        # We vote!
-        for i in range( len( predictions ) ):
-            votes = np.unique(predictions[i], return_counts=True )
-            if len( votes[0] ) == 1: # all Trees agree on one class
-                top_class = votes[0][0];
-            else:
-                top_class_votes = 0
-                top_class_index = 0
-                for j in range( len( votes[1] ) ):
-                    if votes[1][j] > top_class_votes:
-                        top_class_votes = votes[1][j]
-                        top_class_index = j
+        # We vote! Tally the votes for every class of every sample at once
+        classes, votes = np.unique( predictions, return_inverse=True )
+        votes = votes.reshape( predictions.shape )
+        n_samples = predictions.shape[0]
+        counts = np.zeros( ( n_samples, len( classes ) ), dtype=np.int32 )
+        np.add.at( counts, ( np.arange( n_samples )[:, None], votes ), 1 )
 
-                top_class = votes[0][top_class_index]
-            top_voted[i] = top_class
+        # Ties go to the smallest class
+        top_voted = classes[ counts.argmax( axis=1 ) ]
 
         return top_voted
 
@@ -2,8 +2,211 @@ import numpy as np
 import time
 import math
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import draw
+
+try:
+    from numba import njit, prange
+except ImportError:
+    # Numba is optional, without it the split kernels run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    prange = range
+
+
+@njit(cache=True, nogil=True)
+def _best_split_numba(col_sorted, y_sorted, min_leaf, gain_to_beat, left_counts, right_counts):
+    """
+    Sweep one sorted feature column from left to right, moving a sample
+    from the right branch to the left branch each step and keeping the class
+    counts of both branchs up to date.
+
+    The sweep stops early once no split further along can do better than
+    gain_to_beat, the best gain already found on another feature. The left
+    branch only ever gains samples, and the weighted gini of a set is at least
+    the sum of the weighted ginis of its parts, so the weighted gini of the
+    left branch alone bounds every remaining split.
+
+    left_counts and right_counts are scratch buffers, one slot per class,
+    handed in so the counts are not reallocated for every feature.
+
+    Returns the best information gain and the value to split on, half way
+    between the two values either side of the split,
+    or a gain of -1 when no split satisfies the stopping criteria.
+    """
+    n = col_sorted.shape[0]
+    K = left_counts.shape[0]
+    left_counts[:] = 0
+    right_counts[:] = 0
+    for i in range(n):
+        right_counts[y_sorted[i]] += 1
+
+    right_sq = 0.0
+    for k in range(K):
+        right_sq += right_counts[k] * right_counts[k]
+    current_gini = 1.0 - right_sq / (n * n)
+
+    best_gain = -1.0
+    best_value = 0.0
+    for i in range(n - 1):
+        left_counts[y_sorted[i]] += 1
+        right_counts[y_sorted[i]] -= 1
+        left_n = i + 1
+        right_n = n - left_n
+
+        # Stopping criteria, the left grows and the right only shrinks
+        if left_n < min_leaf:
+            continue
+        if right_n < min_leaf:
+            break
+        # Can only split between two different values
+        if col_sorted[i] == col_sorted[i + 1]:
+            continue
+
+        left_sq = 0.0
+        right_sq = 0.0
+        for k in range(K):
+            left_sq += left_counts[k] * left_counts[k]
+            right_sq += right_counts[k] * right_counts[k]
+
+        # Weighted gini of both branchs, 1 - sum(p^2) scaled by branch size
+        gain = current_gini - (n - left_sq / left_n - right_sq / right_n) / n
+        if gain > best_gain:
+            best_gain = gain
+            # Split half way between the two values, unless they are so
+            # close that the half way point rounds onto the left value
+            best_value = 0.5 * (col_sorted[i] + col_sorted[i + 1])
+            if best_value <= col_sorted[i]:
+                best_value = col_sorted[i + 1]
+
+        # Best gain any later split could reach, with a perfectly pure right branch
+        bound = current_gini - (left_n - left_sq / left_n) / n
+        if bound + 1e-12 < gain_to_beat:
+            break
+
+    return best_gain, best_value
+
+
+@njit(cache=True, parallel=True)
+def _best_splits_parallel(cols_sorted, ys_sorted, features, K, min_leaf, gain_to_beat):
+    """
+    Run the split kernel over the features at once, one row of
+    cols_sorted / ys_sorted per feature, all pruned against gain_to_beat.
+    Features not in features are left with a gain of -1.
+    """
+    n_features = cols_sorted.shape[0]
+    gains = np.full(n_features, -1.0)
+    values = np.zeros(n_features)
+    # One pair of count buffers per feature, so the threads never share one
+    counts = np.empty((features.shape[0], 2, K), dtype=np.int64)
+    for j in prange(features.shape[0]):
+        c = features[j]
+        gain, value = _best_split_numba(cols_sorted[c], ys_sorted[c], min_leaf, gain_to_beat, counts[j, 0], counts[j, 1])
+        gains[c] = gain
+        values[c] = value
+    return gains, values
+
+
+@njit(cache=True, nogil=True)
+def _best_binned_split_numba(col_binned, y, n_bins, min_leaf, bin_counts, left_counts, right_counts):
+    """
+    Histogram version of the split kernel for a feature that has been
+    binned. The class counts of every bin are gathered in one pass, then the
+    sweep moves a whole bin at a time from the right branch to the left.
+    bin_counts, with at least n_bins rows, left_counts and right_counts
+    are scratch buffers handed in so they are not reallocated for every
+    feature.
+    Returns the best information gain and the first bin of the right branch,
+    or a gain of -1 when no split satisfies the stopping criteria.
+    """
+    n = col_binned.shape[0]
+    K = left_counts.shape[0]
+    bin_counts[:n_bins] = 0
+    left_counts[:] = 0
+    right_counts[:] = 0
+    for i in range(n):
+        bin_counts[col_binned[i], y[i]] += 1
+        right_counts[y[i]] += 1
+
+    right_sq = 0.0
+    for k in range(K):
+        right_sq += right_counts[k] * right_counts[k]
+    current_gini = 1.0 - right_sq / (n * n)
+
+    # Both branchs need at least one sample
+    min_leaf = max(min_leaf, 1)
+    left_n = 0
+    best_gain = -1.0
+    best_bin = 0
+    for b in range(1, n_bins):
+        for k in range(K):
+            left_counts[k] += bin_counts[b - 1, k]
+            right_counts[k] -= bin_counts[b - 1, k]
+            left_n += bin_counts[b - 1, k]
+        right_n = n - left_n
+
+        # Stopping criteria, the left grows and the right only shrinks
+        if left_n < min_leaf:
+            continue
+        if right_n < min_leaf:
+            break
+
+        left_sq = 0.0
+        right_sq = 0.0
+        for k in range(K):
+            left_sq += left_counts[k] * left_counts[k]
+            right_sq += right_counts[k] * right_counts[k]
+
+        # Weighted gini of both branchs, 1 - sum(p^2) scaled by branch size
+        gain = current_gini - (n - left_sq / left_n - right_sq / right_n) / n
+        if gain > best_gain:
+            best_gain = gain
+            best_bin = b
+
+    return best_gain, best_bin
+
+
+@njit(cache=True, parallel=True)
+def _best_binned_splits_parallel(X_binned, y, features, n_bins, K, min_leaf):
+    """
+    Run the histogram kernel over the features at once,
+    one row of X_binned per feature.
+    Features not in features are left with a gain of -1.
+    """
+    n_features = X_binned.shape[0]
+    gains = np.full(n_features, -1.0)
+    bins = np.zeros(n_features, dtype=np.int64)
+    # One set of count buffers per feature, so the threads never share one
+    bin_counts = np.empty((features.shape[0], n_bins.max(), K), dtype=np.int64)
+    counts = np.empty((features.shape[0], 2, K), dtype=np.int64)
+    for j in prange(features.shape[0]):
+        c = features[j]
+        gain, b = _best_binned_split_numba(
+            X_binned[c], y, n_bins[c], min_leaf, bin_counts[j], counts[j, 0], counts[j, 1]
+        )
+        gains[c] = gain
+        bins[c] = b
+    return gains, bins
+
+# With subsample_search, nodes with more rows than this first rank their
+# features on a subsample of at least _SUBSAMPLE_ROWS rows. Both are
+# empirical, picked on synthetic data rather than derived from a bound
+_SUBSAMPLE_MIN_ROWS = 2000
+_SUBSAMPLE_ROWS = 256
+
+
+def _midpoints(values):
+    """
+    The values half way between each pair of neighbouring sorted unique
+    values, falling back to the upper value when the two are so close that
+    the half way point rounds onto the lower one.
+    """
+    mids = 0.5 * (values[:-1] + values[1:])
+    return np.where(mids <= values[:-1], values[1:], mids)
 
-from helpers import draw, class_counts
 
 class Question:
     """
@@ -28,36 +231,31 @@ class Node:
     and the number of samples in both of these nodes is greater than the early
     stopping criteria.
 
-    If the node is a leaf then it holds a dictionary of the
-    classes and the number of times this class appears in the training data
-    reaching this leaf.
+    If the node is a leaf then it holds the class that appears the most
+    times in the training data reaching this leaf.
     """
     def __init__(
         self,
         is_decision = 0,
-        rows = None,
+        labels = None,
         question = None,
         true_branch = None,
         false_branch = None
     ):
-        if is_decision is 1:
-            self.is_decision = 1
+        self.is_decision = bool( is_decision )
+        if self.is_decision:
             self.question = question
             self.true_branch = true_branch
             self.false_branch = false_branch
         else:
-            self.is_decision = 0;
-            self.predictions = class_counts( rows )
+            self.top_class = 0
+            if len( labels ) > 0:
+                classes, counts = np.unique( labels, return_counts=True )
+                self.top_class = classes[ np.argmax( counts ) ]
 
     # This will be not be called unless the leaf is a node.
     def top_pick( self ):
-        best_class = 0;
-        best_number = 0
-        for pred_class, pred_number in self.predictions.items():
-            if pred_number > best_number:
-                best_class = pred_class
-                best_number = pred_number
-        return best_class
+        return self.top_class
 
 
 class Tree():
@@ -65,13 +263,40 @@ class Tree():
     A Tree begins with a root node, which is eiher a leaf (Not a great tree...)
     or a decision node. The decision node is split on the optimal attribute
     and value of that attribute that results in the most information gain.
-    Then each branch of this initial decision node is recursively generated
-    through the same process, until we reach a stopping criteria.
+    Then each branch of this initial decision node is generated through
+    the same process, until we reach a stopping criteria.
+
+    With max_bins set, each feature is bucketed into at most that many bins
+    before building and only the bin boundaries are tried as split values.
+    Features with no more unique values than max_bins are binned losslessly.
+    max_bins = None searches every unique value of every feature instead.
+
+    With n_threads above 1 the nodes of each level of the tree are split
+    in that many threads at once, and each node searches its own features
+    serially so the threads don't oversubscribe the cores.
+
+    splitter = "random" grows an extremely randomised tree instead, each
+    node tries a single random split value per feature and keeps the best
+    of those. Every node draws from its own Generator, spawned from the
+    one seeded by random_state as the node is queued, so the tree is the
+    same however many threads build it.
+
+    subsample_search = True trades exactness for speed on large nodes, they
+    only search the features that look best on a random subsample of their
+    rows, so the split picked can differ from the best one.
     """
-    def __init__(self, stopping_criteria = 0, is_stump = False, root_node = None, indexs = []):
+    def __init__(self, stopping_criteria = 0, is_stump = False, root_node = None, indexs = [], parallel = True, max_bins = 256, n_threads = 1, splitter = "best", random_state = None, subsample_search = False):
         self.stopping_criteria = stopping_criteria
         self.root_node = None
         self.is_stump = is_stump
+        # Search the features of a node in parallel threads,
+        # turned off when the tree itself is trained inside a parallel forest
+        self.parallel = parallel
+        self.max_bins = max_bins
+        self.n_threads = n_threads
+        self.splitter = splitter
+        self.random_state = random_state
+        self.subsample_search = subsample_search
         if is_stump:
             self.indexs = indexs
 
@@ -79,7 +304,13 @@ class Tree():
     def get_params(self, deep=True):
         return {
             "stopping_criteria": self.stopping_criteria,
-            "root_node": self.root_node
+            "root_node": self.root_node,
+            "parallel": self.parallel,
+            "max_bins": self.max_bins,
+            "n_threads": self.n_threads,
+            "splitter": self.splitter,
+            "random_state": self.random_state,
+            "subsample_search": self.subsample_search
         }
 
 
@@ -90,107 +321,300 @@ class Tree():
         return self
 
 
-    def partition( self, rows, question):
+    def partition( self, idx, question):
         """
-        Partitions a dataset.
-        For each row in the dataset, check if it matches the question.
-        If so, add it to true_rows otherwise add it to false_rows
+        Partitions the training rows at the indices idx.
+        Build a boolean mask of the rows that match the question over the
+        feature column at once, the matching indices are the true_idx
+        and the rest are the false_idx
         """
-        true_rows   = []
-        false_rows  = []
-        for row in rows:
-            if question.match( row ):
-                true_rows.append( row )
-            else:
-                false_rows.append( row )
-        return true_rows, false_rows
+        col = self._Xcol[idx, question.feature]
+        mask = col >= question.value
+        return idx[mask], idx[~mask]
 
 
-    def gini( self, rows):
+    def _gini_from_labels( self, labels ):
         """
-        Calculate the Gini for a list of rows.
+        Calculate the Gini for a column of class labels.
         """
-        counts = class_counts( rows )
-        impurity = 1
-        samples = float( len( rows ))
-        for label in counts:
-            label_p = counts[label] / samples
-            impurity -= label_p**2
-        return impurity
+        _, counts = np.unique( labels, return_counts=True )
+        label_p = counts / counts.sum()
+        return 1.0 - ( label_p * label_p ).sum()
 
 
     def info_gain( self, left, right, current_uncertainty):
         """
-        Information Gain.
+        Information Gain, left and right are the indices of either branch.
         """
         prob_left = float( len( left ) ) / ( len( left ) + len( right ) )
         prob_right = 1 - prob_left
         info_gain = current_uncertainty;
-        info_gain -= prob_left * self.gini( left )
-        info_gain -= prob_right * self.gini ( right )
+        info_gain -= prob_left * self._gini_from_labels( self._y[left] )
+        info_gain -= prob_right * self._gini_from_labels( self._y[right] )
         return info_gain
 
 
-    def find_best_split( self, rows):
+    def _bin( self, X ):
         """
-        Find the best question to ask by iterating over every
-        feature / value and calculating the information gain
+        Bucket every feature of X into at most max_bins bins.
+        The bin edges are the midpoints between the unique values of a feature
+        when there are few enough of them, otherwise its quantiles. A value lands in bin b when
+        edges[b - 1] <= value < edges[b], so "bin >= b" asks the same question
+        as "value >= edges[b - 1]".
+        Returns the binned features, one row per feature, and the edges.
         """
-        most_gain = 0  # keep track of the best information gain
-        best_question = None  # keep train of the column / Value that produced best gain
-        current_gini = self.gini( rows )
+        n_samples, n_features = X.shape
+        dtype = np.uint8 if self.max_bins <= 256 else np.uint16
+        X_binned = np.empty( ( n_features, n_samples ), dtype=dtype )
+        bin_edges = []
+        for c in range( n_features ):
+            col = X[:, c]
+            values = np.unique( col )
+            if len( values ) <= self.max_bins:
+                edges = _midpoints( values )
+            else:
+                quantiles = np.quantile( col, np.linspace( 0, 1, self.max_bins + 1 ) )
+                edges = np.unique( quantiles[1:-1] )
+            X_binned[c] = np.searchsorted( edges, col, side="right" )
+            bin_edges.append( edges )
+        return X_binned, bin_edges
 
-        # for each feature, col here equals 1 feature
-        for col in range( len( rows[0] ) - 1 ):
-            # unique values in the colum
-            values = set( [row[col] for row in rows] )
-            # for each value
-            for val in values:
-                q = Question( col, val )
-                true_rows, false_rows = self.partition( rows, q )
 
-                # If one branch has length less than our stopping_criteria then no split
-                if len( true_rows ) < self.stopping_criteria or len( false_rows ) < self.stopping_criteria:
-                    continue
+    def _sorted_split_gains( self, idx, K, min_leaf, features, prune = True ):
+        """
+        Best gain and split value of each of the features for the rows at idx.
+        The features were sorted once in fit, so the rows of a large node come
+        out already in order by filtering that sort on membership of idx.
+        Then the compiled kernel moves the samples from the right branch to
+        the left branch one at a time, keeping a running count of each class
+        on both sides.
+
+        The features are searched in order of their gains at the previous
+        node, so a good split is found early and the kernel can give up on
+        the features that cannot beat it. Those features report a gain that
+        is lower than their real best, but never one that would be picked.
+        prune = False turns this off, so every gain is exact.
+        """
+        n_samples = len( idx )
+        n_features = self._Xcol.shape[1]
+
+        # Filtering reads every training row, so small nodes deep down the tree
+        # are quicker to just sort again
+        use_presort = n_samples * math.log2( max( n_samples, 2 ) ) > len( self._Xcol )
+        if use_presort:
+            in_node = np.zeros( len( self._Xcol ), dtype=bool )
+            in_node[idx] = True
+
+        # One contiguous row per feature, in sorted order
+        cols_sorted = np.empty( ( n_features, n_samples ) )
+        ys_sorted = np.empty( ( n_features, n_samples ), dtype=np.int64 )
+        for c in features:
+            if use_presort:
+                sorted_idx = self._sorted_idx[:, c]
+                order = sorted_idx[ in_node[sorted_idx] ]
+            else:
+                order = idx[ np.argsort( self._Xcol[idx, c], kind="stable" ) ]
+            cols_sorted[c] = self._Xcol[order, c]
+            ys_sorted[c] = self._y[order]
+
+        in_search = np.zeros( n_features, dtype=bool )
+        in_search[features] = True
+        search_order = self._feature_order[ in_search[self._feature_order] ]
+
+        gains = np.full( n_features, -1.0 )
+        values = np.zeros( n_features )
+        # Every split beats a gain of -1, so without prune nothing is cut short
+        gain_to_beat = 0.0 if prune else -1.0
+        # Count buffers shared by every feature searched in this thread
+        left_counts = np.empty( K, dtype=np.int64 )
+        right_counts = np.empty( K, dtype=np.int64 )
+        if self.parallel and self.n_threads == 1:
+            # The most promising feature first, to give the others a gain to beat
+            c = search_order[0]
+            gains[c], values[c] = _best_split_numba( cols_sorted[c], ys_sorted[c], min_leaf, gain_to_beat, left_counts, right_counts )
+            if prune:
+                gain_to_beat = max( gains[c], gain_to_beat )
+            # The rest at once, leaving out the one already searched
+            rest = search_order[1:]
+            rest_gains, rest_values = _best_splits_parallel( cols_sorted, ys_sorted, rest, K, min_leaf, gain_to_beat )
+            gains[rest] = rest_gains[rest]
+            values[rest] = rest_values[rest]
+        else:
+            for c in search_order:
+                gains[c], values[c] = _best_split_numba( cols_sorted[c], ys_sorted[c], min_leaf, gain_to_beat, left_counts, right_counts )
+                if prune:
+                    gain_to_beat = max( gains[c], gain_to_beat )
 
-                # Calculate the information gain from this split
-                g = self.info_gain( true_rows, false_rows, current_gini )
+        self._feature_order = np.argsort( -gains, kind="stable" )
+        return gains, values
+
+
+    def _binned_split_gains( self, idx, K, min_leaf, features ):
+        """
+        Best gain and split value of each of the features for the rows at idx,
+        only trying the bin boundaries. No sorting is needed, the kernel
+        counts the classes in each bin and sweeps over the bins.
+        """
+        n_features = self._Xbin.shape[0]
+        X_binned = np.empty( ( n_features, len( idx ) ), dtype=self._Xbin.dtype )
+        X_binned[features] = self._Xbin[ np.ix_( features, idx ) ]
+        y = self._y[idx].astype( np.int64 )
+
+        if self.parallel and self.n_threads == 1:
+            gains, bins = _best_binned_splits_parallel( X_binned, y, features, self._n_bins, K, min_leaf )
+        else:
+            gains = np.full( n_features, -1.0 )
+            bins = np.zeros( n_features, dtype=np.int64 )
+            # Count buffers shared by every feature
+            bin_counts = np.empty( ( self._n_bins.max(), K ), dtype=np.int64 )
+            left_counts = np.empty( K, dtype=np.int64 )
+            right_counts = np.empty( K, dtype=np.int64 )
+            for c in features:
+                gains[c], bins[c] = _best_binned_split_numba(
+                    X_binned[c], y, self._n_bins[c], min_leaf, bin_counts, left_counts, right_counts
+                )
+
+        # Map the bins back to the feature values, so questions work on raw data
+        values = np.zeros( n_features )
+        for c in range( n_features ):
+            if gains[c] >= 0:
+                values[c] = self._bin_edges[c][ bins[c] - 1 ]
+        return gains, values
+
+
+    def _random_split_gains( self, idx, K, min_leaf, rng ):
+        """
+        Gain and split value of every feature for the rows at idx, trying
+        just one split value per feature drawn uniformly between the
+        smallest and largest value at this node. No sorting or sweeping,
+        the class counts of every feature's true branch come from a
+        single product with the one hot class labels.
+        """
+        X = self._Xcol[idx]
+        lows = X.min( axis=0 )
+        highs = X.max( axis=0 )
+        values = rng.uniform( lows, highs )
+
+        one_hot = np.eye( K )[ self._y[idx] ]
+        right_counts = ( X >= values ).T.astype( np.float64 ) @ one_hot
+        left_counts = one_hot.sum( axis=0 ) - right_counts
+        right_n = right_counts.sum( axis=1 )
+        left_n = left_counts.sum( axis=1 )
+
+        # Stopping criteria, and constant features have nothing to split
+        valid = ( left_n >= max( min_leaf, 1 ) ) & ( right_n >= max( min_leaf, 1 ) ) & ( highs > lows )
+        left_n[~valid] = 1
+        right_n[~valid] = 1
+
+        # Weighted gini of both branchs, 1 - sum(p^2) scaled by branch size
+        n_samples = len( idx )
+        current_gini = self._gini_from_labels( self._y[idx] )
+        left_sq = ( left_counts * left_counts ).sum( axis=1 ) / left_n
+        right_sq = ( right_counts * right_counts ).sum( axis=1 ) / right_n
+        gains = current_gini - ( n_samples - left_sq - right_sq ) / n_samples
+        gains[~valid] = -1.0
+        return gains, values
+
+
+    def _search_split_gains( self, idx, K, min_leaf, features = None, prune = True ):
+        """
+        Best gain and split value of the features for the rows at idx,
+        searching the bins or every value depending on max_bins.
+        The features left out of features get a gain of -1.
+        prune = False makes the gains exact, the binned search always is.
+        """
+        if features is None:
+            features = np.arange( self._Xcol.shape[1] )
+        if self.max_bins:
+            return self._binned_split_gains( idx, K, min_leaf, features )
+        return self._sorted_split_gains( idx, K, min_leaf, features, prune )
+
+
+    def _promising_features( self, idx, K, min_leaf, rng ):
+        """
+        Rank the features of a large node on a random subsample of its rows
+        and keep the top sqrt(features) of them, so the full search only
+        runs on features that are likely to hold the best split.
+        The subsample has the larger of _SUBSAMPLE_ROWS and sqrt(rows) rows,
+        an empirical size with no guarantee the best feature is kept.
+        The ranking search is not pruned, so every feature is ranked on its
+        exact gain over the subsample.
+        """
+        n_samples = len( idx )
+        n_features = self._Xcol.shape[1]
+        m = min( n_samples, max( _SUBSAMPLE_ROWS, int( math.sqrt( n_samples ) ) ) )
+
+        # Without replacement, the presorted search counts each row once
+        sub_idx = np.sort( rng.choice( idx, size=m, replace=False ) )
+        sub_min_leaf = int( math.ceil( min_leaf * m / n_samples ) )
+        gains, _ = self._search_split_gains( sub_idx, K, sub_min_leaf, prune=False )
+
+        n_keep = int( math.ceil( math.sqrt( n_features ) ) )
+        return np.sort( np.argsort( -gains, kind="stable" )[:n_keep] )
 
-                # If this gain is better than present best gain, record
 
-                if g >= most_gain:
-                    most_gain = g
-                    best_question = q
+    def find_best_split( self, idx, rng ):
+        """
+        Find the best question to ask for the training rows at idx by
+        sweeping over every feature. The gini of every candidate split
+        value comes straight from running counts of each class on both
+        sides of the split. With subsample_search, large nodes only sweep
+        the features that look most promising on a subsample of their rows.
+        Any random draws come from the node's Generator rng.
+        """
+        most_gain = 0  # keep track of the best information gain
+        best_question = None  # keep train of the column / Value that produced best gain
+
+        K = self._K
+        min_leaf = int( math.ceil( self.stopping_criteria ) )
+        if self.splitter == "random":
+            gains, values = self._random_split_gains( idx, K, min_leaf, rng )
+        elif self.subsample_search and len( idx ) > _SUBSAMPLE_MIN_ROWS:
+            features = self._promising_features( idx, K, min_leaf, rng )
+            gains, values = self._search_split_gains( idx, K, min_leaf, features )
+        else:
+            gains, values = self._search_split_gains( idx, K, min_leaf )
+
+        # for each feature, col here equals 1 feature
+        for c in range( len( gains ) ):
+            # If this gain is better than present best gain, record
+            if gains[c] >= most_gain:
+                most_gain = gains[c]
+                best_question = Question( c, values[c] )
 
         return most_gain, best_question
 
 
-    def find_weak_split( self, rows):
+    def find_weak_split( self, idx):
         """
         Find the best question to ask by iterating over every
         feature / value and calculating the information gain
         """
+        n_features = self._Xcol.shape[1]
         # Need to randomise order of featres looked at
-        rand_cols = np.random.choice(len( rows[0] ) - 1, len( rows[0] ) - 1, replace=False)
-        current_gini = self.gini(rows)
-        for col in range( len( rows[0] ) - 1 ):
-            # unique values in the colum
-            values = np.unique([row[rand_cols[col]] for row in rows])
+        rand_cols = np.random.choice(n_features, n_features, replace=False)
+        current_gini = self._gini_from_labels( self._y[idx] )
+        for col in range( n_features ):
+            # split half way between the unique values in the colum
+            values = np.unique( self._Xcol[idx, rand_cols[col]] )
+            if len( values ) < 2:
+                continue
+            values = _midpoints( values )
             rand_values = np.random.choice(len(values), len(values), replace=False)
             # for each value
 
             for val in range(len(values)):
                 random_value = values[rand_values[val]]
                 q = Question(rand_cols[col], random_value )
-                true_rows, false_rows = self.partition( rows, q )
+                true_idx, false_idx = self.partition( idx, q )
 
                 # If one branch has length less than our stopping_criteria then no split
-                if len( true_rows ) < self.stopping_criteria or len( false_rows ) < self.stopping_criteria:
+                if len( true_idx ) < self.stopping_criteria or len( false_idx ) < self.stopping_criteria:
                     continue
 
                 # Calculate the information gain from this split
 
-                g = self.info_gain( true_rows, false_rows, current_gini)
+                g = self.info_gain( true_idx, false_idx, current_gini)
 
                 # If the split gives a 10% or better increase in info
 
@@ -204,104 +628,201 @@ class Tree():
         """
         Importing training data and setting stopping criteria
 
-        Create a new 2d numpy array.
-        Append the target class, for ever array of data labels giving us:
-        merged_train[i] = [ x[i][0], x[i][1], x[i][2], x[i][3], y[i] ]
-        This reduces the complexity because we don't have to pass on two arrays
+        The features are stored column major, so the split search reads
+        each feature from contiguous memory, and the class labels are mapped
+        onto 0..K-1 so they can index the class counts directly.
+        The tree is then built from arrays of indices into this data
+        rather than copies of the rows.
+        When max_bins is set the features are binned once here as well,
+        otherwise every feature is sorted once here.
         """
+        x = np.asarray( x )
+        y = np.asarray( y )
         if self.is_stump:
-            merged_train = np.empty([len(self.indexs), len(x[0]) + 1])
-            for i in range( len(self.indexs)):
-                merged_train[i] = np.append( x[ self.indexs[ i ] ], y[ self.indexs[ i ] ] )
-        else:
-            merged_train = np.empty([len(x), len(x[0]) + 1])
-            for i in range(len(x)):
-                merged_train[i] = np.append( x[i], y[i])
-
+            x = x[ self.indexs ]
+            y = y[ self.indexs ]
+        self._Xcol = np.asfortranarray( x, dtype=np.float64 )
+        self._classes, self._y = np.unique( y, return_inverse=True )
+        self._y = self._y.astype( np.intp )
+        self._K = len( self._classes )
+        self._rng = np.random.default_rng( self.random_state )
 
         if stopping_criteria != 0:
             self.stopping_criteria = stopping_criteria
         else:
-            self.stopping_criteria = len( merged_train ) / 10
+            self.stopping_criteria = len( x ) / 10
 
-        if not self.is_stump:
-            self.root_node = self.build(merged_train)
+        idx = np.arange( len( x ) )
+        if self.is_stump:
+            self.root_node = self.build_stump( idx )
         else:
-            self.root_node = self.build_stump(merged_train)
+            # The random splitter needs neither bins nor sorting
+            if self.splitter != "random" and self.max_bins:
+                self._Xbin, self._bin_edges = self._bin( self._Xcol )
+                self._n_bins = np.array( [ len( edges ) + 1 for edges in self._bin_edges ], dtype=np.int64 )
+            elif self.splitter != "random":
+                self._sorted_idx = np.asfortranarray( np.argsort( self._Xcol, axis=0, kind="stable" ) )
+                self._feature_order = np.arange( self._Xcol.shape[1] )
+            self.root_node = self.build( idx )
+        self.flatten()
+
+        # The training data is only needed while building
+        for name in [ "_Xcol", "_y", "_K", "_rng", "_Xbin", "_bin_edges", "_n_bins", "_sorted_idx", "_feature_order" ]:
+            self.__dict__.pop( name, None )
 
 
-    def build_stump(self, rows):
+    def build_stump(self, idx):
 
         """
         Builds the tree
         Non recursive, used for the stumps!
         """
-        gain, question = self.find_weak_split( rows)
+        gain, question = self.find_weak_split( idx )
 
         # Partition dataset based on best question
-        true_rows, false_rows = self.partition( rows, question )
+        true_idx, false_idx = self.partition( idx, question )
         # Build the true branch
-        true_branch = Node(0, true_rows )
+        true_branch = Node(0, self._classes[ self._y[true_idx] ] )
         # Build the false branch
-        false_branch = Node(0, false_rows )
+        false_branch = Node(0, self._classes[ self._y[false_idx] ] )
         # Return the Decision node, with references to question and branchs
         return Node(1, None, question, true_branch, false_branch)
 
 
-    def build( self, rows ):
+    def build_node( self, idx, rng ):
         """
-        Builds the tree.
-        Recursive AF!
+        Builds a single node from the training rows at the indices idx,
+        drawing any randomness from the node's own Generator rng.
+        Returns the node along with the branchs it still needs, as
+        ( parent, branch name, indices ) for each.
         """
 
         # Determine the best attribute and split value that gives most info gain
-        gain, question = self.find_best_split( rows )
+        gain, question = self.find_best_split( idx, rng )
 
-        # This is the base case, no further info gain to be made. Stop Recursion
+        # This is the base case, no further info gain to be made. Stop here
         if gain == 0:
-            return Node(0, rows)
+            return Node(0, self._classes[ self._y[idx] ]), []
 
         # Partition dataset based on best question
-        true_rows, false_rows = self.partition( rows, question )
+        true_idx, false_idx = self.partition( idx, question )
 
-        # Build the true branch via recursion
-        true_branch = self.build( true_rows )
+        # Return the Decision node, its branchs get filled in once they are built
+        node = Node(1, None, question)
+        return node, [ ( node, "true_branch", true_idx ), ( node, "false_branch", false_idx ) ]
 
-        # Build the false branch via recursion
-        false_branch = self.build( false_rows )
 
-        # Return the Decision node, with references to question and branchs
-        return Node(1, None, question, true_branch, false_branch)
+    def build( self, idx ):
+        """
+        Builds the tree from the training rows at the indices idx.
+        No recursion, the tree is built a level at a time from a queue of
+        the branchs still to be built, each level split across the
+        threads when n_threads is above 1.
+        """
+        root_node, pending = self.build_node( idx, self._rng )
+
+        pool = ThreadPoolExecutor( max_workers=self.n_threads ) if self.n_threads > 1 else None
+        build_all = pool.map if pool else map
+        try:
+            while pending:
+                # Spawned here rather than in the threads, so the draws don't
+                # depend on the order the threads get to them
+                rngs = self._rng.spawn( len( pending ) )
+                built = build_all( self.build_node, [ branch_idx for _, _, branch_idx in pending ], rngs )
+                next_pending = []
+                for ( parent, branch, _ ), ( node, children ) in zip( pending, built ):
+                    setattr( parent, branch, node )
+                    next_pending.extend( children )
+                pending = next_pending
+        finally:
+            if pool:
+                pool.shutdown()
+
+        return root_node
+
+    def flatten( self ):
+        """
+        Lay the built tree out as parallel arrays, one entry per node,
+        so whole batches of rows can be classified without walking the
+        Node objects. Node 0 is the root. Decision nodes hold the feature
+        and value of their question and the ids of their branchs, the true
+        branch being on the right. Leaves have a left id of -1 and hold
+        their top class.
+        """
+        feature = []
+        threshold = []
+        left = []
+        right = []
+        leaf_class = []
+
+        # Breadth first, children get their ids as their parent is visited
+        nodes = [ self.root_node ]
+        i = 0
+        while i < len( nodes ):
+            node = nodes[i]
+            if node.is_decision:
+                feature.append( node.question.feature )
+                threshold.append( node.question.value )
+                left.append( len( nodes ) )
+                nodes.append( node.false_branch )
+                right.append( len( nodes ) )
+                nodes.append( node.true_branch )
+                leaf_class.append( 0 )
+            else:
+                feature.append( 0 )
+                threshold.append( 0.0 )
+                left.append( -1 )
+                right.append( -1 )
+                leaf_class.append( node.top_pick() )
+            i += 1
+
+        self.feature = np.array( feature, dtype=np.intp )
+        self.threshold = np.array( threshold, dtype=np.float64 )
+        self.left = np.array( left, dtype=np.intp )
+        self.right = np.array( right, dtype=np.intp )
+        self.leaf_class = np.array( leaf_class )
+
+
+    def classify_batch( self, x ):
+        """
+        Classify every row of x at once using the flattened tree.
+        Each pass moves all of the rows that are still on a decision
+        node one level further down, so it loops at most depth times.
+        """
+        x = np.asarray( x, dtype=np.float64 )
+        rows = np.arange( len( x ) )
+        node_idx = np.zeros( len( x ), dtype=np.intp )
+
+        active = rows[ self.left[node_idx] >= 0 ]
+        while len( active ) > 0:
+            nodes = node_idx[active]
+            go_right = x[active, self.feature[nodes]] >= self.threshold[nodes]
+            node_idx[active] = np.where( go_right, self.right[nodes], self.left[nodes] )
+            active = active[ self.left[ node_idx[active] ] >= 0 ]
+
+        return self.leaf_class[node_idx]
+
 
     def score(self, x, y):
         n = len(x)
-        correct = 0;
-        for i in range(n):
-            if self.classify( x[i] , self.root_node ) == y[i]:
-                correct += 1
+        correct = np.sum( self.classify_batch( x ) == y )
         return correct / n
 
     def predict( self, x, y):
         n = len(x)
-        correct = 0;
-        for i in range(n):
-            if self.classify( x[i] , self.root_node ) == y[i]:
-                correct += 1
+        correct = np.sum( self.classify_batch( x ) == y )
 
         print( "N: %s\tC: %s\t%.2f%%" % ( n, correct, ( correct / n * 100 ) ) )
 
     # used by random forest as a 1 to 1
     def get_predictions(self, x):
-        y_preds = []
-        for i in range( len(x) ):
-            y_preds.append( int( self.classify( x[i], self.root_node ) ) )
-        return y_preds
+        return self.classify_batch( x ).astype( int ).tolist()
 
 
     def classify( self, row, node):
 
         # Base Case: Leaf!
-        if node.is_decision is 0:
+        if not node.is_decision:
             return node.top_pick()
 
         if node.question.match(row):